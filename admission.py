@@ -0,0 +1,288 @@
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from flask import g, request, jsonify
+
+from auth import request_identity
+
+DEFAULT_CLASS = 'normal'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS slots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    endpoint TEXT NOT NULL,
+    started_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_slots_endpoint ON slots (endpoint);
+CREATE INDEX IF NOT EXISTS ix_slots_started_at ON slots (started_at);
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_buckets_updated_at ON buckets (updated_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queue_times (
+    endpoint TEXT PRIMARY KEY,
+    samples INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    last_ms REAL NOT NULL
+);
+'''
+
+# Milliseconds the release in teardown may wait for the lock; a slot that
+# still can't be freed expires after ADMISSION_SLOT_TTL
+RELEASE_TIMEOUT_MS = 500
+
+
+def priority(name):
+    """Assign a view to an admission class (see ADMISSION_CLASSES)"""
+    def decorator(f):
+        f.admission_class = name
+        return f
+    return decorator
+
+
+def rate_key(key_func):
+    """Also rate-limit a view by key_func(), on top of the caller's user id or IP"""
+    def decorator(f):
+        f.admission_key = key_func
+        return f
+    return decorator
+
+
+def default_state_path():
+    # Prefer tmpfs so the shared state never touches a real disk
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'sampark-admission.db')
+
+
+def queue_time_ms(header):
+    """Time since the proxy received the request, from an X-Request-Start style
+    header ("t=<epoch>" in s, ms or us), or None if absent or unparseable"""
+    value = request.headers.get(header) if header else None
+    if not value:
+        return None
+    try:
+        started = float(value.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, (time.time() - started) * 1000)
+
+
+class AdmissionStore:
+    """Host-wide admission state in a small SQLite file.
+
+    Every gunicorn worker opens the same file, and each decision runs in a
+    single BEGIN IMMEDIATE transaction, so in-flight counts and token
+    buckets are shared and updated atomically across processes. In-flight
+    requests are rows rather than counters, so a worker that dies mid
+    request only leaks a slot until slot_ttl expires it. The lock timeout
+    is kept short: callers get sqlite3.OperationalError instead of waiting.
+    """
+
+    PRUNE_INTERVAL = 10
+
+    def __init__(self, path, slot_ttl=60, lock_timeout=0.05, bucket_ttl=60):
+        self.path = path
+        self.slot_ttl = slot_ttl
+        self.lock_timeout = lock_timeout
+        self.bucket_ttl = bucket_ttl
+        self._local = threading.local()
+        self._pruned_at = 0.0
+
+    def _conn(self):
+        # Connections are per thread and never reused across a fork
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def admit(self, endpoint, buckets, limits, max_inflight, queue_ms=None):
+        """Return (slot_id, None, None) if admitted, else (None, status, retry_after).
+
+        buckets is a list of (key, rate, burst); admission takes a token from
+        every one of them and is refused if any is empty.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._prune(conn, now)
+
+            if queue_ms is not None:
+                conn.execute(
+                    'INSERT INTO queue_times (endpoint, samples, total_ms, max_ms, last_ms) '
+                    'VALUES (?, 1, ?, ?, ?) ON CONFLICT (endpoint) DO UPDATE SET '
+                    'samples = samples + 1, total_ms = total_ms + excluded.total_ms, '
+                    'max_ms = max(max_ms, excluded.max_ms), last_ms = excluded.last_ms',
+                    (endpoint, queue_ms, queue_ms, queue_ms)
+                )
+                # Already waited too long in the proxy or listen queue; the
+                # client has likely given up, so don't spend a thread on it
+                if queue_ms > limits['max_queue_ms']:
+                    return self._reject(conn, endpoint, 503, limits['retry_after'])
+
+            # Token buckets for this client in this class
+            tokens = {}
+            wait = 0
+            for key, rate, burst in buckets:
+                row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens[key] = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                if tokens[key] < 1:
+                    wait = max(wait, math.ceil((1 - tokens[key]) / rate))
+            if wait:
+                for key, left in tokens.items():
+                    self._save_bucket(conn, key, left, now)
+                return self._reject(conn, endpoint, 429, wait)
+
+            # Per-route cap, and this class's share of the host's capacity
+            route_inflight = conn.execute('SELECT COUNT(*) FROM slots WHERE endpoint = ?', (endpoint,)).fetchone()[0]
+            total_inflight = conn.execute('SELECT COUNT(*) FROM slots').fetchone()[0]
+            if (route_inflight >= max_inflight * limits['route_share']
+                    or total_inflight >= max_inflight * limits['share']):
+                return self._reject(conn, endpoint, 503, limits['retry_after'])
+
+            for key, left in tokens.items():
+                self._save_bucket(conn, key, left - 1, now)
+            self._bump(conn, f'admitted:{endpoint}')
+            slot_id = conn.execute('INSERT INTO slots (endpoint, started_at) VALUES (?, ?)',
+                                   (endpoint, now)).lastrowid
+            conn.execute('COMMIT')
+            return slot_id, None, None
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release(self, slot_id):
+        conn = self._conn()
+        conn.execute(f'PRAGMA busy_timeout = {RELEASE_TIMEOUT_MS}')
+        try:
+            conn.execute('DELETE FROM slots WHERE id = ?', (slot_id,))
+        finally:
+            conn.execute(f'PRAGMA busy_timeout = {int(self.lock_timeout * 1000)}')
+
+    def stats(self):
+        conn = self._conn()
+        inflight = dict(conn.execute('SELECT endpoint, COUNT(*) FROM slots GROUP BY endpoint'))
+        counters = {}
+        for name, value in conn.execute('SELECT name, value FROM counters'):
+            kind, endpoint = name.split(':', 1)
+            counters.setdefault(endpoint, {})[kind] = value
+        queue = {
+            endpoint: {
+                'samples': samples,
+                'avg_ms': round(total_ms / samples, 1),
+                'max_ms': round(max_ms, 1),
+                'last_ms': round(last_ms, 1)
+            }
+            for endpoint, samples, total_ms, max_ms, last_ms in conn.execute('SELECT * FROM queue_times')
+        }
+        return {'inflight': inflight, 'queue_time': queue, 'counters': counters}
+
+    def _reject(self, conn, endpoint, status, retry_after):
+        self._bump(conn, f'rejected_{status}:{endpoint}')
+        conn.execute('COMMIT')
+        return None, status, retry_after
+
+    def _prune(self, conn, now):
+        """Expire leaked slots and drop buckets idle long enough to be full again"""
+        if now - self._pruned_at < self.PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        conn.execute('DELETE FROM slots WHERE started_at < ?', (now - self.slot_ttl,))
+        conn.execute('DELETE FROM buckets WHERE updated_at < ?', (now - self.bucket_ttl,))
+
+    @staticmethod
+    def _save_bucket(conn, key, tokens, now):
+        conn.execute('INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                     'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                     (key, tokens, now))
+
+    @staticmethod
+    def _bump(conn, name):
+        conn.execute('INSERT INTO counters (name, value) VALUES (?, 1) '
+                     'ON CONFLICT (name) DO UPDATE SET value = value + 1', (name,))
+
+
+def init_app(app):
+    """Shed load before it reaches the views: 429 on rate limits, 503 when full"""
+    if not app.config.get('ADMISSION_ENABLED'):
+        return
+
+    classes = app.config['ADMISSION_CLASSES']
+    max_inflight = app.config['ADMISSION_MAX_INFLIGHT']
+    queue_header = app.config.get('ADMISSION_QUEUE_HEADER')
+    # An idle bucket refills completely within burst / rate seconds, after
+    # which its row is equivalent to no row at all
+    bucket_ttl = max(max(c['burst'] / c['rate'], c['anonymous_burst'] / c['anonymous_rate'])
+                     for c in classes.values())
+    store = AdmissionStore(app.config.get('ADMISSION_STATE_PATH') or default_state_path(),
+                           app.config.get('ADMISSION_SLOT_TTL', 60),
+                           app.config.get('ADMISSION_LOCK_TIMEOUT', 0.05),
+                           bucket_ttl)
+    app.extensions['admission'] = store
+
+    @app.before_request
+    def admit_request():
+        view = app.view_functions.get(request.endpoint)
+        if view is None or request.method == 'OPTIONS':
+            return None
+
+        name = getattr(view, 'admission_class', DEFAULT_CLASS)
+        limits = classes[name]
+        identity = request_identity()
+        if identity.startswith('ip-'):
+            buckets = [(f'{name}:{identity}', limits['anonymous_rate'], limits['anonymous_burst'])]
+        else:
+            buckets = [(f'{name}:{identity}', limits['rate'], limits['burst'])]
+        key_func = getattr(view, 'admission_key', None)
+        if key_func:
+            # A per-key bucket on top of the caller's own, so e.g. one IP
+            # can't get around its ceiling by cycling through accounts
+            buckets.append((f'{name}:{key_func()}', limits['rate'], limits['burst']))
+
+        try:
+            slot_id, status, retry_after = store.admit(
+                request.endpoint, buckets, limits, max_inflight, queue_time_ms(queue_header)
+            )
+        except sqlite3.OperationalError as e:
+            # The shared state is locked or unavailable: never block on it
+            print(f"❌ Admission state unavailable: {e}")
+            if limits.get('fail_open'):
+                return None
+            slot_id, status, retry_after = None, 503, limits['retry_after']
+
+        if slot_id is None:
+            error = 'Too many requests' if status == 429 else 'Server busy, please retry'
+            response = jsonify({'error': error})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, status
+
+        g.admission_slot = slot_id
+        return None
+
+    @app.teardown_request
+    def release_slot(exc):
+        slot_id = g.pop('admission_slot', None)
+        if slot_id is None:
+            return
+        try:
+            store.release(slot_id)
+        except sqlite3.OperationalError as e:
+            print(f"❌ Could not release admission slot {slot_id}: {e}")
@@ -1,7 +1,7 @@
-from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Blueprint, request, jsonify, current_app
 from flask_cors import CORS
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 from datetime import datetime
 from dotenv import load_dotenv
@@ -10,40 +10,46 @@ load_dotenv()  # ← ADD THIS
 from auth import generate_token, verify_token, generate_credentials
 from email_service import send_credentials_email
 from config import Config
-
-app = Flask(__name__)
-app.config.from_object(Config)
-
-CORS(app, resources={
-    r"/api/*": {
-        "origins": [
-            "http://localhost:5173",
-            "http://localhost:5174", 
-            "https://sampark-frontend-beta.vercel.app"
-        ],
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
+import admission
+import db_routing
+from admission import priority, rate_key
+from db_routing import read_only
 
 from models import db  # import the unbound db
-db.init_app(app)       # bind it to the Flask app
-migrate = Migrate(app, db)
+from models import Event, User, Connection, Theme, UserStats, BadgeRevocation
+from badges import issue_badge, verify_badge, public_card
+from dashboards import dashboard, pending_totals
+from events import current_event_id
+
+# Extensions are created unbound and attached in create_app(), so importing
+# this module never opens a database connection or touches the schema.
+cors = CORS()
+migrate = Migrate()
+
+api = Blueprint('api', __name__)
 
+# ==================== EVENT ROUTES ====================
 
-# Import models after db initialization
-from models import User, Connection, Theme
+@api.route('/api/events', methods=['GET'])
+@read_only
+def get_events():
+    """List events open for registration"""
+    events = Event.query.filter_by(status='active').order_by(Event.created_at.desc()).all()
+    return jsonify([event.to_dict() for event in events]), 200
 
 # ==================== REGISTRATION ROUTES ====================
 
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register_user():
     """Receive registration data (from Google Form webhook or direct)"""
     data = request.json
+    # Outside the try: an unknown ?event= has to stay a 404
+    event_id = current_event_id()
     
     try:
         # Create new user with pending status
         user = User(
+            event_id=event_id,
             name=data['name'],
             email=data['email'],
             phone=data.get('phone'),
@@ -62,7 +68,9 @@ def register_user():
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
-@app.route('/api/admin/pending-registrations', methods=['GET', 'OPTIONS'])
+@api.route('/api/admin/pending-registrations', methods=['GET', 'OPTIONS'])
+@priority('low')
+@read_only
 def get_pending_registrations():
     """Admin: Get all pending registrations"""
     
@@ -77,14 +85,16 @@ def get_pending_registrations():
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        pending_users = User.query.filter_by(status='pending').all()
+        pending_users = User.query.filter_by(
+            event_id=current_event_id(user_data), status='pending'
+        ).all()
         print(f"✅ Found {len(pending_users)} pending users")
         return jsonify([user.to_dict() for user in pending_users]), 200
     except Exception as e:
         print(f"❌ Error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/admin/approve/<int:user_id>', methods=['POST'])
+@api.route('/api/admin/approve/<int:user_id>', methods=['POST'])
 def approve_registration(user_id):
     """Admin: Approve a registration and send credentials"""
     token = request.headers.get('Authorization')
@@ -101,6 +111,8 @@ def approve_registration(user_id):
     password = generate_credentials()
     user.set_password(password)
     user.status = 'approved'
+    if user.stats is None:
+        user.stats = UserStats(connection_count=0, dignitary_connection_count=0)
     db.session.commit()
     
     # Send email with credentials
@@ -113,7 +125,7 @@ def approve_registration(user_id):
     
     return jsonify({'message': 'User approved and credentials sent'}), 200
 
-@app.route('/api/admin/reject/<int:user_id>', methods=['POST', 'OPTIONS'])
+@api.route('/api/admin/reject/<int:user_id>', methods=['POST', 'OPTIONS'])
 def reject_registration(user_id):
     """Admin: Reject a registration"""
     
@@ -133,13 +145,22 @@ def reject_registration(user_id):
     
     # Update status to rejected
     user.status = 'rejected'
+    BadgeRevocation.bump(user.registration_number)
     db.session.commit()
     
     return jsonify({'message': 'User registration rejected'}), 200
 
 # ==================== AUTHENTICATION ROUTES ====================
 
-@app.route('/api/login', methods=['POST'])
+def _login_rate_key():
+    # Per account per IP, checked on top of the IP's own bucket: attendees
+    # behind one venue NAT don't share this one, but the IP keeps a ceiling
+    data = request.get_json(silent=True) or {}
+    return f"login-{request.remote_addr}-{data.get('registration_number')}"
+
+@api.route('/api/login', methods=['POST'])
+@priority('critical')
+@rate_key(_login_rate_key)
 def login():
     """User login with registration number and password"""
     data = request.json
@@ -156,7 +177,7 @@ def login():
     if user.status != 'approved':
         return jsonify({'error': 'Account not approved yet'}), 403
     
-    token = generate_token(user.id, user.is_admin)
+    token = generate_token(user.id, user.is_admin, user.event_id)
     return jsonify({
         'token': token,
         'user': user.to_dict()
@@ -166,7 +187,7 @@ def login():
 
 # ==================== USER PROFILE ROUTES ====================
 
-@app.route('/api/profile', methods=['GET'])
+@api.route('/api/profile', methods=['GET'])
 def get_profile():
     """Get current user's profile"""
     token = request.headers.get('Authorization')
@@ -176,9 +197,12 @@ def get_profile():
         return jsonify({'error': 'Unauthorized'}), 401
     
     user = User.query.get(user_data['user_id'])
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
     return jsonify(user.to_dict(include_themes=True)), 200
 
-@app.route('/api/profile', methods=['PUT'])
+@api.route('/api/profile', methods=['PUT'])
 def update_profile():
     """Update user profile"""
     token = request.headers.get('Authorization')
@@ -188,6 +212,9 @@ def update_profile():
         return jsonify({'error': 'Unauthorized'}), 401
     
     user = User.query.get(user_data['user_id'])
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
     data = request.json
     
     # Update basic fields
@@ -202,15 +229,19 @@ def update_profile():
         Theme.query.filter_by(user_id=user.id).delete()
         # Add new themes
         for theme_name in data['themes']:
-            theme = Theme(user_id=user.id, name=theme_name)
+            theme = Theme(event_id=user.event_id, user_id=user.id, name=theme_name)
             db.session.add(theme)
+        # Themes are on the badge, so badges issued before this are stale
+        BadgeRevocation.bump(user.registration_number)
     
     db.session.commit()
     return jsonify(user.to_dict(include_themes=True)), 200
 
 # ==================== NFC/SCAN ROUTES ====================
 
-@app.route('/api/scan/<registration_number>', methods=['GET'])
+@api.route('/api/scan/<registration_number>', methods=['GET'])
+@priority('critical')
+@read_only
 def scan_profile(registration_number):
     """Get user profile by registration number (NFC scan)"""
     user = User.query.filter_by(registration_number=registration_number).first()
@@ -220,7 +251,43 @@ def scan_profile(registration_number):
     
     return jsonify(user.to_dict(include_themes=True)), 200
 
-@app.route('/api/connect', methods=['POST'])
+@api.route('/api/badge', methods=['GET'])
+def get_badge():
+    """Issue a signed badge for the current user's public card"""
+    token = request.headers.get('Authorization')
+    user_data = verify_token(token)
+    
+    if not user_data:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user = User.query.get(user_data['user_id'])
+    if not user or user.status != 'approved':
+        return jsonify({'error': 'User not found'}), 404
+    
+    return jsonify({'badge': issue_badge(user)}), 200
+
+@api.route('/api/badge/verify', methods=['GET'])
+@priority('critical')
+@read_only
+def verify_badge_scan():
+    """Render a scanned badge; only stale badges touch the users table"""
+    card, is_current = verify_badge(request.args.get('badge'))
+    
+    if not card:
+        return jsonify({'error': 'Invalid badge'}), 400
+    
+    if is_current:
+        return jsonify({**card, 'source': 'badge'}), 200
+    
+    # Profile changed after this badge was issued: fall back to a live lookup
+    user = User.query.filter_by(registration_number=card['registration_number']).first()
+    if not user or user.status != 'approved':
+        return jsonify({'error': 'User not found'}), 404
+    
+    return jsonify({**public_card(user), 'source': 'live'}), 200
+
+@api.route('/api/connect', methods=['POST'])
+@priority('critical')
 def create_connection():
     """Create a connection between two users"""
     token = request.headers.get('Authorization')
@@ -232,12 +299,18 @@ def create_connection():
     data = request.json
     scanned_reg_number = data.get('scanned_registration_number')
     
+    current_user = db.session.get(User, user_data['user_id'])
+    if not current_user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
     scanned_user = User.query.filter_by(registration_number=scanned_reg_number).first()
-    if not scanned_user:
+    if not scanned_user or scanned_user.event_id != current_user.event_id:
         return jsonify({'error': 'Scanned user not found'}), 404
     
+    event_id = current_user.event_id
+    
     # Check if connection already exists
-    existing = Connection.query.filter(
+    existing = Connection.query.filter(Connection.event_id == event_id).filter(
         ((Connection.user_id == user_data['user_id']) & (Connection.connected_user_id == scanned_user.id)) |
         ((Connection.user_id == scanned_user.id) & (Connection.connected_user_id == user_data['user_id']))
     ).first()
@@ -246,16 +319,29 @@ def create_connection():
         return jsonify({'message': 'Connection already exists'}), 200
     
     # Create bidirectional connection
-    connection1 = Connection(user_id=user_data['user_id'], connected_user_id=scanned_user.id)
-    connection2 = Connection(user_id=scanned_user.id, connected_user_id=user_data['user_id'])
+    now = datetime.utcnow()
+    connection1 = Connection(event_id=event_id, user_id=current_user.id, connected_user_id=scanned_user.id, connected_at=now)
+    connection2 = Connection(event_id=event_id, user_id=scanned_user.id, connected_user_id=current_user.id, connected_at=now)
     
     db.session.add(connection1)
     db.session.add(connection2)
+    
+    # Keep per-user counters in the same transaction as the connections.
+    # Rows are locked in a fixed order so two people scanning each other at
+    # the same moment can't deadlock.
+    pairs = sorted([(current_user, scanned_user), (scanned_user, current_user)], key=lambda pair: pair[0].id)
+    for user, connected_user in pairs:
+        UserStats.record_connection(user.id, connected_user, now)
     db.session.commit()
     
+    # Event-wide dashboard totals are hot rows every connect would queue on;
+    # count them in this worker and write them in batches instead
+    pending_totals.record_connection(event_id, [current_user.organization, scanned_user.organization], now)
+    
     return jsonify({'message': 'Connection created successfully'}), 201
 
-@app.route('/api/connections', methods=['GET'])
+@api.route('/api/connections', methods=['GET'])
+@read_only
 def get_connections():
     """Get all connections for current user"""
     token = request.headers.get('Authorization')
@@ -264,7 +350,16 @@ def get_connections():
     if not user_data:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    connections = Connection.query.filter_by(user_id=user_data['user_id']).all()
+    # Use the stored event, not the token's: tokens issued before events
+    # existed carry none. Leading with event_id lets Postgres prune to this
+    # event's partition.
+    user = db.session.get(User, user_data['user_id'])
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    connections = Connection.query.filter_by(
+        event_id=user.event_id, user_id=user.id
+    ).all()
     
     result = []
     for conn in connections:
@@ -279,23 +374,29 @@ def get_connections():
 
 # ==================== ANALYTICS ROUTES ====================
 
-@app.route('/api/analytics/themes', methods=['GET'])
+@api.route('/api/analytics/themes', methods=['GET'])
+@priority('low')
+@read_only
 def get_theme_participants():
     """Get all participants grouped by themes"""
     theme_name = request.args.get('theme')
+    event_id = current_event_id()
     
     if theme_name:
-        themes = Theme.query.filter_by(name=theme_name).all()
+        themes = Theme.query.filter_by(event_id=event_id, name=theme_name).all()
         users = [User.query.get(t.user_id).to_dict() for t in themes]
         return jsonify({'theme': theme_name, 'participants': users}), 200
     
     # Get all themes with count
-    themes_count = db.session.query(Theme.name, db.func.count(Theme.user_id)).group_by(Theme.name).all()
+    themes_count = db.session.query(Theme.name, db.func.count(Theme.user_id)) \
+        .filter(Theme.event_id == event_id).group_by(Theme.name).all()
     result = [{'name': name, 'count': count} for name, count in themes_count]
     
     return jsonify(result), 200
 
-@app.route('/api/analytics/stats', methods=['GET'])
+@api.route('/api/analytics/stats', methods=['GET'])
+@priority('low')
+@read_only
 def get_stats():
     """Get overall statistics"""
     token = request.headers.get('Authorization')
@@ -304,18 +405,83 @@ def get_stats():
     if not user_data:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    user = User.query.get(user_data['user_id'])
-    connection_count = Connection.query.filter_by(user_id=user.id).count()
+    # One primary-key lookup; counters and themes come back in the same query
+    user = User.query.options(
+        db.joinedload(User.stats), db.joinedload(User.themes)
+    ).filter_by(id=user_data['user_id']).first()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    stats = user.stats or UserStats(connection_count=0, dignitary_connection_count=0)
     
     return jsonify({
-        'total_connections': connection_count,
+        **stats.to_dict(),
         'registration_number': user.registration_number,
         'themes': [t.name for t in user.themes]
     }), 200
 
+# ==================== DASHBOARD ROUTES ====================
+
+def _dashboard_limit():
+    limit = request.args.get('limit', 10, type=int)
+    return max(1, min(limit, current_app.config.get('DASHBOARD_TOP_K', 50)))
+
+@api.route('/api/dashboard/top-connectors', methods=['GET'])
+@priority('low')
+@read_only
+def get_top_connectors():
+    """Admin: Attendees with the most connections"""
+    token = request.headers.get('Authorization')
+    user_data = verify_token(token)
+    
+    if not user_data or not user_data.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    snapshot = dashboard.snapshot(current_event_id(user_data))
+    return jsonify({
+        'top_connectors': snapshot['top_connectors'][:_dashboard_limit()],
+        'generated_at': snapshot['generated_at']
+    }), 200
+
+@api.route('/api/dashboard/top-organizations', methods=['GET'])
+@priority('low')
+@read_only
+def get_top_organizations():
+    """Admin: Organizations whose members made the most connections"""
+    token = request.headers.get('Authorization')
+    user_data = verify_token(token)
+    
+    if not user_data or not user_data.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    snapshot = dashboard.snapshot(current_event_id(user_data))
+    return jsonify({
+        'top_organizations': snapshot['top_organizations'][:_dashboard_limit()],
+        'generated_at': snapshot['generated_at']
+    }), 200
+
+@api.route('/api/dashboard/connections-per-hour', methods=['GET'])
+@priority('low')
+@read_only
+def get_connections_per_hour():
+    """Admin: Connections created per hour over the recent window"""
+    token = request.headers.get('Authorization')
+    user_data = verify_token(token)
+    
+    if not user_data or not user_data.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    snapshot = dashboard.snapshot(current_event_id(user_data))
+    return jsonify({
+        'connections_per_hour': snapshot['connections_per_hour'],
+        'generated_at': snapshot['generated_at']
+    }), 200
+
 # ==================== ADMIN ROUTES ====================
 
-@app.route('/api/admin/users', methods=['GET'])
+@api.route('/api/admin/users', methods=['GET'])
+@priority('low')
+@read_only
 def get_all_users():
     """Admin: Get all users"""
     token = request.headers.get('Authorization')
@@ -324,36 +490,75 @@ def get_all_users():
     if not user_data or not user_data.get('is_admin'):
         return jsonify({'error': 'Unauthorized'}), 401
     
-    users = User.query.all()
+    users = User.query.filter_by(event_id=current_event_id(user_data)).all()
     return jsonify([user.to_dict() for user in users]), 200
 
 
 
 
-# ==================== RUN APP ====================
+@api.route('/api/admin/admission', methods=['GET'])
+def get_admission_stats():
+    """Admin: In-flight requests, proxy queue time and admission counters per route"""
+    token = request.headers.get('Authorization')
+    user_data = verify_token(token)
+    
+    if not user_data or not user_data.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    store = current_app.extensions.get('admission')
+    if store is None:
+        return jsonify({'enabled': False}), 200
+    
+    return jsonify({'enabled': True, **store.stats()}), 200
 
 
 
 
-with app.app_context():
-    db.create_all()
-    admin_email = 'admin@sampark.com'
-    existing = User.query.filter_by(email=admin_email).first()
-    if existing:
-            print("Admin already exists!")
-    else:
-            admin = User(
-            name='Admin User',
-            email=admin_email,
-            phone='1234567890',
-            organization='Sampark',
-            registration_number='ADMIN001',
-            status='approved',
-            is_admin=True
-        )
-            admin.set_password('xd62oum3mt')
-            db.session.add(admin)
-            db.session.commit()
-            print("Admin created! Login: ADMIN001 / xd62oum3mt")
+# ==================== APP FACTORY ====================
+
+def create_app(config_class=Config):
+    """Build and configure a Flask app instance.
+
+    No queries or DDL run here; use `flask --app app seed` to create the
+    schema and the first admin user.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    if app.config.get('TRUSTED_PROXIES'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+    cors.init_app(app, resources={
+        r"/api/*": {
+            "origins": [
+                "http://localhost:5173",
+                "http://localhost:5174", 
+                "https://sampark-frontend-beta.vercel.app"
+            ],
+            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization"]
+        }
+    })
+
+    db.init_app(app)       # bind it to the Flask app
+    migrate.init_app(app, db, render_as_batch=True)  # SQLite can only ALTER by copying the table
+    admission.init_app(app)
+    db_routing.init_app(app, db)
+
+    app.register_blueprint(api)
+
+    from commands import (seed_command, reconcile_stats_command, rebuild_dashboards_command,
+                          create_event_command, partition_connections_command, archive_event_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(reconcile_stats_command)
+    app.cli.add_command(rebuild_dashboards_command)
+    app.cli.add_command(create_event_command)
+    app.cli.add_command(partition_connections_command)
+    app.cli.add_command(archive_event_command)
+
+    return app
+
+
+# ==================== RUN APP ====================
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -7,12 +7,15 @@ from flask import request, jsonify
 import os
 
 SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
+# Separate key so a badge can never be accepted as a login token, or vice versa
+BADGE_SECRET_KEY = os.getenv('BADGE_SECRET_KEY', SECRET_KEY + ':badge')
 
-def generate_token(user_id, is_admin=False):
-    """Generate JWT token for user"""
+def generate_token(user_id, is_admin=False, event_id=None):
+    """Generate JWT token for user, scoped to the event they registered for"""
     payload = {
         'user_id': user_id,
         'is_admin': is_admin,
+        'event_id': event_id,
         'exp': datetime.utcnow() + timedelta(days=30)  # Token expires in 30 days
     }
     token = jwt.encode(payload, SECRET_KEY, algorithm='HS256')
@@ -35,6 +38,30 @@ def verify_token(token):
     except jwt.InvalidTokenError:
         return None
 
+def generate_badge_token(claims):
+    """Sign a badge payload (public profile snapshot) as a compact JWT"""
+    payload = dict(claims, typ='badge', iat=datetime.utcnow())
+    return jwt.encode(payload, BADGE_SECRET_KEY, algorithm='HS256')
+
+def verify_badge_token(token):
+    """Verify a badge token and return its claims, or None"""
+    if not token:
+        return None
+    
+    try:
+        payload = jwt.decode(token, BADGE_SECRET_KEY, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    
+    return payload if payload.get('typ') == 'badge' else None
+
+def request_identity():
+    """Identify the caller: user id from the token, else the remote address"""
+    user_data = verify_token(request.headers.get('Authorization'))
+    if user_data:
+        return f"user-{user_data['user_id']}"
+    return f"ip-{request.remote_addr}"
+
 def generate_credentials():
     """Generate random password for new users"""
     length = 12
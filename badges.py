@@ -0,0 +1,91 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+
+from auth import generate_badge_token, verify_badge_token
+from events import active_event_ids
+from models import BadgeRevocation
+
+
+def public_card(user):
+    """The display card shown when someone scans a badge"""
+    return {
+        'event_id': user.event_id,
+        'registration_number': user.registration_number,
+        'name': user.name,
+        'organization': user.organization,
+        'themes': [theme.name for theme in user.themes],
+        'is_dignitary': user.is_dignitary
+    }
+
+
+def issue_badge(user):
+    """Sign the user's current public card at their current badge version"""
+    card = public_card(user)
+    return generate_badge_token({
+        'sub': card['registration_number'],
+        'e': card['event_id'],
+        'v': BadgeRevocation.current_version(user.registration_number),
+        'n': card['name'],
+        'o': card['organization'],
+        't': card['themes'],
+        'd': card['is_dignitary']
+    })
+
+
+class RevocationList:
+    """Per-worker copy of badge_revocations.
+
+    Refreshed incrementally (only rows revoked since the last refresh) at
+    most once per BADGE_REVOCATION_REFRESH_SECONDS, so verifying a badge
+    normally runs no query at all.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._since = datetime.min
+        self._loaded_at = None
+
+    def version(self, registration_number):
+        ttl = current_app.config.get('BADGE_REVOCATION_REFRESH_SECONDS', 5)
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > ttl:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at > ttl:
+                    self._refresh()
+        return self._versions.get(registration_number, 0)
+
+    def _refresh(self):
+        # Overlap the window so rows stamped by a slightly behind clock, or
+        # not yet on the replica, are still picked up
+        since = self._since - timedelta(seconds=60) if self._since > datetime.min else self._since
+        rows = BadgeRevocation.query.filter(BadgeRevocation.revoked_at >= since).all()
+        for row in rows:
+            self._versions[row.registration_number] = row.version
+            self._since = max(self._since, row.revoked_at)
+        self._loaded_at = time.monotonic()
+
+
+revocations = RevocationList()
+
+
+def verify_badge(token):
+    """Return (card, is_current) for a valid badge, or (None, False)"""
+    claims = verify_badge_token(token)
+    if not claims:
+        return None, False
+
+    card = {
+        'event_id': claims.get('e'),
+        'registration_number': claims['sub'],
+        'name': claims['n'],
+        'organization': claims['o'],
+        'themes': claims['t'],
+        'is_dignitary': claims['d']
+    }
+    # Badges of archived events are never current; their users are gone, so
+    # the live lookup turns them away
+    if card['event_id'] is not None and card['event_id'] not in active_event_ids():
+        return card, False
+    return card, claims['v'] >= revocations.version(claims['sub'])
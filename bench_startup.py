@@ -0,0 +1,38 @@
+"""Measure cold-start time of the app factory.
+
+Usage: python bench_startup.py [runs]
+
+Each run starts a fresh interpreter, imports app and calls create_app(), so
+the numbers reflect what a new gunicorn master or autoscaled instance pays.
+"""
+import statistics
+import subprocess
+import sys
+
+SNIPPET = (
+    "import time; t0 = time.perf_counter(); "
+    "import app; t1 = time.perf_counter(); "
+    "app.create_app(); t2 = time.perf_counter(); "
+    "print(t1 - t0, t2 - t1)"
+)
+
+
+def run_once():
+    out = subprocess.check_output([sys.executable, '-c', SNIPPET], text=True)
+    import_time, factory_time = (float(x) for x in out.split())
+    return import_time, factory_time
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    results = [run_once() for _ in range(runs)]
+    imports = [r[0] * 1000 for r in results]
+    factories = [r[1] * 1000 for r in results]
+
+    print(f"runs: {runs}")
+    print(f"import app     median {statistics.median(imports):7.1f} ms  max {max(imports):7.1f} ms")
+    print(f"create_app()   median {statistics.median(factories):7.1f} ms  max {max(factories):7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+import gzip
+import json
+import os
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_migrate import stamp, upgrade
+
+import dashboards
+from events import create_partition, is_partitioned, partition_name
+from models import (db, Event, User, Theme, Connection, UserStats, OrganizationStats,
+                    HourlyStats, BadgeRevocation, RecentWrite)
+
+
+# The schema db.create_all() made before migrations existed
+BASELINE_REVISION = '0001_baseline'
+
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """Migrate the database and create the first admin user (run once per deploy)"""
+    tables = db.inspect(db.engine).get_table_names()
+    if 'users' in tables and 'alembic_version' not in tables:
+        stamp(revision=BASELINE_REVISION)
+    upgrade()
+    admin_email = 'admin@sampark.com'
+    existing = User.query.filter_by(email=admin_email).first()
+    if existing:
+        print("Admin already exists!")
+        return
+
+    admin = User(
+        name='Admin User',
+        email=admin_email,
+        phone='1234567890',
+        organization='Sampark',
+        registration_number='ADMIN001',
+        status='approved',
+        is_admin=True
+    )
+    admin.set_password('xd62oum3mt')
+    db.session.add(admin)
+    db.session.commit()
+    print("Admin created! Login: ADMIN001 / xd62oum3mt")
+
+
+@click.command('reconcile-stats')
+@click.option('--dry-run', is_flag=True, help='Report drift without fixing it.')
+@with_appcontext
+def reconcile_stats_command(dry_run):
+    """Rebuild user_stats from connections and report any drift"""
+    expected = UserStats.compute()
+    current = {stats.user_id: stats for stats in UserStats.query.all()}
+    empty = dict.fromkeys(UserStats.COUNTERS)
+    empty.update(connection_count=0, dignitary_connection_count=0)
+
+    drifted = 0
+    for user_id in sorted(set(expected) | set(current)):
+        want = expected.get(user_id, empty)
+        stats = current.get(user_id)
+        have = {k: getattr(stats, k) for k in UserStats.COUNTERS} if stats else empty
+        if have == want:
+            continue
+
+        drifted += 1
+        diff = ', '.join(f"{k}: {have[k]} -> {want[k]}" for k in UserStats.COUNTERS if have[k] != want[k])
+        print(f"⚠️ user {user_id}: {diff}")
+        if not dry_run:
+            stats = stats or UserStats(user_id=user_id)
+            for key, value in want.items():
+                setattr(stats, key, value)
+            db.session.add(stats)
+
+    if not dry_run:
+        db.session.commit()
+    print(f"✅ Checked {len(set(expected) | set(current))} users, {drifted} drifted"
+          + (" (not fixed, dry run)" if dry_run and drifted else ""))
+
+
+@click.command('rebuild-dashboards')
+@with_appcontext
+def rebuild_dashboards_command():
+    """Recompute organization and hourly dashboard totals from connections"""
+    organizations, hours = dashboards.rebuild()
+    print(f"✅ Rebuilt {organizations} organizations and {hours} hourly buckets")
+    print("Top connectors come from user_stats; run reconcile-stats to rebuild them.")
+
+
+@click.command('create-event')
+@click.argument('slug')
+@click.argument('name')
+@click.option('--adopt-legacy', is_flag=True,
+              help='Move users, themes and connections created before events existed into this event.')
+@with_appcontext
+def create_event_command(slug, name, adopt_legacy):
+    """Create an event (and its connections partition on Postgres)"""
+    event = Event(slug=slug, name=name)
+    db.session.add(event)
+    db.session.flush()
+    create_partition(event.id)
+
+    if adopt_legacy:
+        # Admins stay event-less so they can manage every event
+        User.query.filter(User.event_id.is_(None), User.is_admin.isnot(True)) \
+            .update({'event_id': event.id}, synchronize_session=False)
+        for model in (Theme, Connection):
+            model.query.filter(model.event_id.is_(None)) \
+                .update({'event_id': event.id}, synchronize_session=False)
+        for model in (OrganizationStats, HourlyStats):
+            model.query.filter_by(event_id=0).update({'event_id': event.id}, synchronize_session=False)
+
+    db.session.commit()
+    print(f"✅ Created event {slug} (id {event.id})")
+
+
+@click.command('partition-connections')
+@with_appcontext
+def partition_connections_command():
+    """Postgres: convert connections into a table partitioned by event_id"""
+    if db.engine.dialect.name != 'postgresql':
+        print("Partitioning needs Postgres; nothing to do.")
+        return
+    if is_partitioned():
+        print("connections is already partitioned.")
+        return
+
+    unassigned = Connection.query.filter(Connection.event_id.is_(None)).count()
+    if unassigned:
+        print(f"❌ {unassigned} connections have no event; run create-event --adopt-legacy first.")
+        return
+
+    run = lambda sql: db.session.execute(db.text(sql))
+    run('ALTER TABLE connections RENAME TO connections_unpartitioned')
+    sequence = db.session.execute(db.text(
+        "SELECT pg_get_serial_sequence('connections_unpartitioned', 'id')"
+    )).scalar()
+    # The partition key has to be part of the primary key
+    run('CREATE TABLE connections (LIKE connections_unpartitioned INCLUDING DEFAULTS, '
+        'PRIMARY KEY (id, event_id)) PARTITION BY LIST (event_id)')
+    for event in Event.query.all():
+        create_partition(event.id)
+    run('CREATE TABLE connections_default PARTITION OF connections DEFAULT')
+    run('INSERT INTO connections SELECT * FROM connections_unpartitioned')
+    if sequence:
+        run(f'ALTER SEQUENCE {sequence} OWNED BY connections.id')
+    run('DROP TABLE connections_unpartitioned')
+    run('ALTER TABLE connections ADD FOREIGN KEY (event_id) REFERENCES events (id)')
+    run('ALTER TABLE connections ADD FOREIGN KEY (user_id) REFERENCES users (id)')
+    run('ALTER TABLE connections ADD FOREIGN KEY (connected_user_id) REFERENCES users (id)')
+    run('CREATE INDEX ix_connections_event_user ON connections (event_id, user_id)')
+    run('CREATE INDEX ix_connections_event_connected_user ON connections (event_id, connected_user_id)')
+    db.session.commit()
+    print("✅ connections is now partitioned by event_id")
+
+
+# Never copied into archives
+ARCHIVE_EXCLUDED_COLUMNS = {'password_hash'}
+
+
+def _write_ndjson(path, table, event_id):
+    """Stream one event's rows of table into a gzipped NDJSON file readable only by us"""
+    columns = [c for c in table.columns if c.name not in ARCHIVE_EXCLUDED_COLUMNS]
+    rows = db.session.execute(
+        db.select(*columns).where(table.c.event_id == event_id).execution_options(yield_per=1000)
+    ).mappings()
+    count = 0
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with gzip.open(os.fdopen(fd, 'wb'), 'wt', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(dict(row), default=str))
+            f.write('\n')
+            count += 1
+    return count
+
+
+@click.command('archive-event')
+@click.argument('slug')
+@click.option('--out', 'out_dir', default=None, help='Directory for the archive (default ARCHIVE_DIR).')
+@with_appcontext
+def archive_event_command(slug, out_dir):
+    """Export an event to gzipped NDJSON and remove it from the live tables"""
+    event = Event.query.filter_by(slug=slug).first()
+    if not event or event.status == 'archived':
+        print(f"❌ No active event {slug}")
+        return
+
+    path = os.path.join(out_dir or current_app.config['ARCHIVE_DIR'], slug)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    for name, model in (('users', User), ('themes', Theme), ('connections', Connection)):
+        count = _write_ndjson(os.path.join(path, f'{name}.ndjson.gz'), model.__table__, event.id)
+        print(f"📦 {name}: {count} rows")
+
+    user_ids = db.session.query(User.id).filter(User.event_id == event.id)
+    reg_numbers = db.session.query(User.registration_number).filter(User.event_id == event.id)
+
+    if is_partitioned():
+        # Detaching is a catalog change; no rows are rewritten or vacuumed
+        db.session.execute(db.text(f'ALTER TABLE connections DETACH PARTITION {partition_name(event.id)}'))
+        db.session.execute(db.text(f'DROP TABLE {partition_name(event.id)}'))
+    else:
+        Connection.query.filter_by(event_id=event.id).delete(synchronize_session=False)
+
+    for model in (UserStats, RecentWrite):
+        model.query.filter(model.user_id.in_(user_ids)).delete(synchronize_session=False)
+    BadgeRevocation.query.filter(BadgeRevocation.registration_number.in_(reg_numbers)) \
+        .delete(synchronize_session=False)
+    for model in (OrganizationStats, HourlyStats, Theme, User):
+        model.query.filter_by(event_id=event.id).delete(synchronize_session=False)
+
+    event.status = 'archived'
+    event.archive_path = path
+    db.session.commit()
+    print(f"✅ Archived {slug} to {path}")
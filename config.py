@@ -1,5 +1,33 @@
+import multiprocessing
 import os
 from datetime import timedelta
+from dotenv import load_dotenv
+
+# Config reads the environment when this module is imported, which for
+# gunicorn happens (via gunicorn.conf.py) before app.py runs load_dotenv()
+load_dotenv()
+
+
+def build_engine_options(uri):
+    """SQLAlchemy engine options for a database URL, tuned from env vars"""
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'True') == 'True',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+
+    if uri.startswith('sqlite'):
+        # SQLite has no server-side pool or statement timeout to tune
+        return options
+
+    options['pool_size'] = int(os.getenv('DB_POOL_SIZE', 10))
+    options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    options['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT', 10))
+
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+    if uri.startswith('postgres') and statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+
+    return options
 
 class Config:
     """Flask configuration"""
@@ -14,6 +42,69 @@ class Config:
         'sqlite:///sampark.db'  # Default to SQLite for development
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = build_engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_WAL = os.getenv('SQLITE_WAL', 'True') == 'True'
+
+    # Optional read replica for read-only routes (see db_routing.py)
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {
+        'replica': {'url': DATABASE_REPLICA_URL, **build_engine_options(DATABASE_REPLICA_URL)}
+    } if DATABASE_REPLICA_URL else {}
+    # After a write, keep that user's reads on the primary for this many
+    # seconds (tracked per user in recent_writes)
+    DB_READ_YOUR_WRITES_SECONDS = int(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 5))
+
+    # Organizer dashboards (see dashboards.py)
+    DASHBOARD_REFRESH_SECONDS = int(os.getenv('DASHBOARD_REFRESH_SECONDS', 10))
+    DASHBOARD_TOP_K = int(os.getenv('DASHBOARD_TOP_K', 50))
+    DASHBOARD_HOURS = int(os.getenv('DASHBOARD_HOURS', 48))
+    # How often each worker writes its buffered organization/hourly counts
+    DASHBOARD_FLUSH_SECONDS = int(os.getenv('DASHBOARD_FLUSH_SECONDS', 5))
+
+    # How often each worker picks up newly revoked badges (see badges.py)
+    BADGE_REVOCATION_REFRESH_SECONDS = int(os.getenv('BADGE_REVOCATION_REFRESH_SECONDS', 5))
+    
+    # Events: slug used when a request names no event (else the newest active one)
+    CURRENT_EVENT = os.getenv('CURRENT_EVENT')
+    EVENT_CACHE_SECONDS = int(os.getenv('EVENT_CACHE_SECONDS', 60))
+    # Outside the app tree; archives hold attendee contact details
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(os.path.expanduser('~'), 'sampark-archives'))
+    
+    # Number of proxies in front of the app that set X-Forwarded-For
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 1))
+    
+    # gunicorn capacity (read by gunicorn.conf.py): gthread workers x threads
+    WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+    GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', 8))
+    
+    # Admission control (see admission.py). ADMISSION_MAX_INFLIGHT is the
+    # number of requests the host can run at once; a class is admitted only
+    # while total in-flight is under its share of it, and each route of the
+    # class under route_share, so lower classes are shed first. Requests
+    # that already waited longer than max_queue_ms (per ADMISSION_QUEUE_HEADER,
+    # set by the proxy) are shed with 503 regardless.
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True') == 'True'
+    ADMISSION_STATE_PATH = os.getenv('ADMISSION_STATE_PATH')
+    ADMISSION_MAX_INFLIGHT = int(os.getenv('ADMISSION_MAX_INFLIGHT', WEB_CONCURRENCY * GUNICORN_THREADS))
+    ADMISSION_QUEUE_HEADER = os.getenv('ADMISSION_QUEUE_HEADER', 'X-Request-Start')
+    ADMISSION_SLOT_TTL = int(os.getenv('ADMISSION_SLOT_TTL', 60))
+    # How long a request may wait for the shared state's lock before it is
+    # shed (or, for fail_open classes, let through unchecked)
+    ADMISSION_LOCK_TIMEOUT = float(os.getenv('ADMISSION_LOCK_TIMEOUT', 0.05))
+    ADMISSION_CLASSES = {
+        # scan, connect, login. Anonymous callers (keyed by IP) get much
+        # larger buckets since a venue's attendees often share one NAT IP.
+        'critical': {'share': 1.0, 'route_share': 0.75, 'max_queue_ms': 10000,
+                     'rate': 10, 'burst': 40, 'anonymous_rate': 200, 'anonymous_burst': 1000,
+                     'retry_after': 1, 'fail_open': True},
+        'normal': {'share': 0.75, 'route_share': 0.5, 'max_queue_ms': 5000,
+                   'rate': 2, 'burst': 10, 'anonymous_rate': 20, 'anonymous_burst': 100,
+                   'retry_after': 2, 'fail_open': False},
+        # analytics, dashboards, admin listings
+        'low': {'share': 0.5, 'route_share': 0.25, 'max_queue_ms': 2000,
+                'rate': 0.5, 'burst': 5, 'anonymous_rate': 5, 'anonymous_burst': 25,
+                'retry_after': 5, 'fail_open': False},
+    }
     
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', SECRET_KEY)
@@ -0,0 +1,184 @@
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+
+from models import db, User, Connection, UserStats, OrganizationStats, HourlyStats
+
+
+class Dashboard:
+    """Per-worker snapshot of the organizer dashboards.
+
+    The running totals live in user_stats (updated inside the connect
+    transaction) and in organization_stats and hourly_stats (written in
+    batches by PendingTotals). Each worker reads the top of those tables at
+    most once per DASHBOARD_REFRESH_SECONDS and serves requests from the
+    cached snapshot, so all workers converge on the same numbers and a
+    restart needs no rescan of connections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # event_id -> (snapshot, loaded_at)
+        self._snapshots = {}
+
+    def _fresh(self, event_id, ttl):
+        cached = self._snapshots.get(event_id)
+        return cached if cached and time.monotonic() - cached[1] <= ttl else None
+
+    def snapshot(self, event_id=None):
+        ttl = current_app.config.get('DASHBOARD_REFRESH_SECONDS', 10)
+        cached = self._fresh(event_id, ttl)
+        if cached is None:
+            with self._lock:
+                # Another thread may have refreshed while we waited
+                cached = self._fresh(event_id, ttl)
+                if cached is None:
+                    cached = (self._load(event_id), time.monotonic())
+                    self._snapshots[event_id] = cached
+        return cached[0]
+
+    def invalidate(self):
+        self._snapshots = {}
+
+    def _load(self, event_id):
+        top_k = current_app.config.get('DASHBOARD_TOP_K', 50)
+        hours = current_app.config.get('DASHBOARD_HOURS', 48)
+
+        top_users = db.session.query(UserStats, User).join(User, User.id == UserStats.user_id) \
+            .filter(User.event_id == event_id) \
+            .order_by(UserStats.connection_count.desc()).limit(top_k).all()
+        top_orgs = OrganizationStats.query.filter_by(event_id=event_id or 0) \
+            .order_by(OrganizationStats.connection_count.desc()).limit(top_k).all()
+        since = HourlyStats.bucket_for(datetime.utcnow() - timedelta(hours=hours))
+        per_hour = HourlyStats.query.filter_by(event_id=event_id or 0) \
+            .filter(HourlyStats.bucket >= since) \
+            .order_by(HourlyStats.bucket).all()
+
+        return {
+            'top_connectors': [{
+                'id': user.id,
+                'name': user.name,
+                'organization': user.organization,
+                'registration_number': user.registration_number,
+                'connections': stats.connection_count
+            } for stats, user in top_users],
+            'top_organizations': [org.to_dict() for org in top_orgs],
+            'connections_per_hour': [bucket.to_dict() for bucket in per_hour],
+            'generated_at': datetime.utcnow().isoformat()
+        }
+
+
+dashboard = Dashboard()
+
+
+class PendingTotals:
+    """Per-worker organization and hourly counts not yet in the database.
+
+    Every connect in an event would otherwise update the same hourly_stats
+    row and a handful of organization_stats rows, serializing connects on
+    those row locks. Instead connects only count here, and a background
+    thread adds the counts to the tables every DASHBOARD_FLUSH_SECONDS in
+    one short transaction of its own. Rows are updated in key order so
+    workers flushing together can't deadlock. Counts still buffered when a
+    worker dies are lost; rebuild() recomputes both tables from connections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (event_id, organization) -> count, (event_id, bucket) -> count
+        self._organizations = {}
+        self._hours = {}
+        self._pid = None
+
+    def record_connection(self, event_id, organizations, connected_at):
+        event_id = event_id or 0
+        bucket = HourlyStats.bucket_for(connected_at)
+        with self._lock:
+            for organization in organizations:
+                if organization:
+                    key = (event_id, organization)
+                    self._organizations[key] = self._organizations.get(key, 0) + 1
+            self._hours[(event_id, bucket)] = self._hours.get((event_id, bucket), 0) + 1
+            if self._pid != os.getpid():
+                # First connect in this worker (threads don't survive a fork)
+                self._pid = os.getpid()
+                self._start(current_app._get_current_object())
+
+    def _start(self, app):
+        def run():
+            interval = app.config.get('DASHBOARD_FLUSH_SECONDS', 5)
+            while True:
+                time.sleep(interval)
+                with app.app_context():
+                    self.flush()
+
+        threading.Thread(target=run, name='dashboard-flush', daemon=True).start()
+        atexit.register(lambda: self._flush_at_exit(app))
+
+    def _flush_at_exit(self, app):
+        with app.app_context():
+            self.flush()
+
+    def flush(self):
+        """Add the buffered counts to the tables (commits)"""
+        with self._lock:
+            organizations, self._organizations = self._organizations, {}
+            hours, self._hours = self._hours, {}
+        if not organizations and not hours:
+            return
+
+        try:
+            for (event_id, organization), count in sorted(organizations.items()):
+                OrganizationStats.record_connection(event_id, organization, count)
+            for (event_id, bucket), count in sorted(hours.items()):
+                HourlyStats.record_connection(event_id, bucket, count)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Could not flush dashboard totals, retrying later: {e}")
+            with self._lock:
+                for key, count in organizations.items():
+                    self._organizations[key] = self._organizations.get(key, 0) + count
+                for key, count in hours.items():
+                    self._hours[key] = self._hours.get(key, 0) + count
+
+
+pending_totals = PendingTotals()
+
+
+def rebuild():
+    """Recompute organization_stats and hourly_stats from connections (commits).
+
+    Counts workers haven't flushed yet are added on top when they flush, so
+    run this while connects are quiet.
+    """
+    OrganizationStats.query.delete()
+    HourlyStats.query.delete()
+
+    org_counts = db.session.query(Connection.event_id, User.organization, db.func.count(Connection.id)) \
+        .join(User, User.id == Connection.user_id) \
+        .filter(User.organization.isnot(None), User.organization != '') \
+        .group_by(Connection.event_id, User.organization)
+    organizations = 0
+    for event_id, organization, count in org_counts:
+        db.session.add(OrganizationStats(event_id=event_id or 0, organization=organization,
+                                         connection_count=count))
+        organizations += 1
+
+    # Each connect stores two mirrored rows; count only one of them
+    hourly = {}
+    moments = db.session.query(Connection.event_id, Connection.connected_at) \
+        .filter(Connection.user_id < Connection.connected_user_id) \
+        .execution_options(yield_per=1000)
+    for event_id, connected_at in moments:
+        key = (event_id or 0, HourlyStats.bucket_for(connected_at))
+        hourly[key] = hourly.get(key, 0) + 1
+    for (event_id, bucket), count in hourly.items():
+        db.session.add(HourlyStats(event_id=event_id, bucket=bucket, connection_count=count))
+
+    db.session.commit()
+    dashboard.invalidate()
+    return organizations, len(hourly)
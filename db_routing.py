@@ -0,0 +1,75 @@
+from flask import g, request, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+from auth import verify_token
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def read_only(f):
+    """Mark a view as safe to serve from the read replica"""
+    f.db_read_only = True
+    return f
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica while the request allows it"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing
+                and has_request_context() and g.get('db_use_replica')):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _enable_sqlite_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+def init_app(app, db):
+    """Enable SQLite WAL and, when a replica is configured, read routing"""
+    if app.config.get('SQLITE_WAL'):
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == 'sqlite':
+                    event.listen(engine, 'connect', _enable_sqlite_wal)
+
+    if 'replica' not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    # Writes are remembered per user in recent_writes on the primary, so for
+    # DB_READ_YOUR_WRITES_SECONDS that user's reads stay on the primary,
+    # whichever worker or host serves them. Anonymous callers have no writes
+    # of their own to read back, so they always use the replica.
+    from models import RecentWrite
+    window = app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+
+    @app.before_request
+    def choose_database():
+        view = app.view_functions.get(request.endpoint)
+        if request.method in SAFE_METHODS and getattr(view, 'db_read_only', False):
+            user_data = verify_token(request.headers.get('Authorization'))
+            g.db_use_replica = not (user_data and RecentWrite.within(user_data['user_id'], window))
+
+    @app.after_request
+    def remember_write(response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return response
+        user_data = verify_token(request.headers.get('Authorization'))
+        if user_data:
+            try:
+                RecentWrite.touch(user_data['user_id'])
+                db.session.commit()
+            except Exception as e:
+                # The write itself already succeeded; worst case the next
+                # read comes from a replica that is a moment behind
+                db.session.rollback()
+                print(f"❌ Could not record write for user {user_data['user_id']}: {e}")
+        return response
@@ -0,0 +1,79 @@
+import time
+from flask import current_app, request, jsonify, make_response, abort
+
+from models import db, Event
+
+# slug (or None for "the default event") -> (event_id, loaded_at)
+_event_ids = {}
+# (frozenset of active event ids, loaded_at)
+_active_event_ids = (frozenset(), None)
+
+
+def event_id_for(slug):
+    """Resolve an active event's slug to its id, cached per worker"""
+    ttl = current_app.config.get('EVENT_CACHE_SECONDS', 60)
+    cached = _event_ids.get(slug)
+    if cached and time.monotonic() - cached[1] < ttl:
+        return cached[0]
+
+    query = Event.query.filter_by(status='active')
+    if slug:
+        event = query.filter_by(slug=slug).first()
+        if not event:
+            abort(make_response(jsonify({'error': 'Event not found'}), 404))
+    else:
+        event = query.order_by(Event.created_at.desc()).first()
+
+    event_id = event.id if event else None
+    _event_ids[slug] = (event_id, time.monotonic())
+    return event_id
+
+
+def active_event_ids():
+    """Ids of all active events, cached per worker"""
+    global _active_event_ids
+    ttl = current_app.config.get('EVENT_CACHE_SECONDS', 60)
+    ids, loaded_at = _active_event_ids
+    if loaded_at is None or time.monotonic() - loaded_at >= ttl:
+        ids = frozenset(row.id for row in Event.query.filter_by(status='active').with_entities(Event.id))
+        _active_event_ids = (ids, time.monotonic())
+    return ids
+
+
+def current_event_id(user_data=None):
+    """The event a request belongs to.
+
+    The event in the caller's token wins; otherwise an explicit
+    ?event=<slug> (or "event" in a JSON body), then CURRENT_EVENT, then the
+    newest active event. None means no events exist yet, which matches rows
+    created before events were introduced.
+    """
+    if user_data and user_data.get('event_id'):
+        return user_data['event_id']
+
+    body = request.get_json(silent=True) if request.is_json else None
+    slug = request.args.get('event') or (body or {}).get('event') or current_app.config.get('CURRENT_EVENT')
+    return event_id_for(slug)
+
+
+def is_partitioned(table='connections'):
+    """True when Postgres declarative partitioning is set up for table"""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(db.text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table"
+    ), {'table': table}).first() is not None
+
+
+def partition_name(event_id):
+    return f'connections_e{int(event_id)}'
+
+
+def create_partition(event_id):
+    """Give an event its own connections partition (no-op unless partitioned)"""
+    if is_partitioned():
+        db.session.execute(db.text(
+            f'CREATE TABLE IF NOT EXISTS {partition_name(event_id)} '
+            f'PARTITION OF connections FOR VALUES IN ({int(event_id)})'
+        ))
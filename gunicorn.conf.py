@@ -0,0 +1,24 @@
+import os
+
+from config import Config
+
+# Build the app once in the master and fork workers from it, so each worker
+# starts warm instead of re-importing Flask, SQLAlchemy and the models.
+wsgi_app = 'app:create_app()'
+preload_app = True
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Threaded workers: workers x threads is the host's in-flight capacity, and
+# Config.ADMISSION_MAX_INFLIGHT defaults to the same product.
+worker_class = 'gthread'
+workers = Config.WEB_CONCURRENCY
+threads = Config.GUNICORN_THREADS
+
+
+def post_fork(server, worker):
+    """Drop pooled connections inherited from the master after fork"""
+    from models import db
+    app = server.app.wsgi()
+    with app.app_context():
+        db.engine.dispose()
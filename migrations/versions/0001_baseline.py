@@ -0,0 +1,69 @@
+"""baseline schema
+
+The tables as db.create_all() made them before migrations existed. A
+database created that way is stamped at this revision (flask seed does it
+automatically) and upgraded from here.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('phone', sa.String(length=20), nullable=True),
+    sa.Column('organization', sa.String(length=100), nullable=True),
+    sa.Column('registration_number', sa.String(length=20), nullable=False),
+    sa.Column('password_hash', sa.String(length=255), nullable=True),
+    sa.Column('bio', sa.Text(), nullable=True),
+    sa.Column('interests', sa.Text(), nullable=True),
+    sa.Column('linkedin', sa.String(length=200), nullable=True),
+    sa.Column('twitter', sa.String(length=200), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('is_admin', sa.Boolean(), nullable=True),
+    sa.Column('is_dignitary', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    # Unnamed, as create_all left it (Postgres calls it users_email_key)
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('registration_number')
+    )
+    op.create_table('themes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('connections',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('connected_user_id', sa.Integer(), nullable=False),
+    sa.Column('connected_at', sa.DateTime(), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['connected_user_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('connections')
+    op.drop_table('themes')
+    op.drop_table('users')
@@ -0,0 +1,82 @@
+"""counter, dashboard, badge and read-routing tables
+
+user_stats starts empty; run `flask reconcile-stats` and
+`flask rebuild-dashboards` once after upgrading to fill the counters from
+existing connections.
+
+Revision ID: 0002_counters
+Revises: 0001_baseline
+Create Date: 2026-10-19 19:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_counters'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('connection_count', sa.Integer(), nullable=False),
+    sa.Column('dignitary_connection_count', sa.Integer(), nullable=False),
+    sa.Column('first_connected_at', sa.DateTime(), nullable=True),
+    sa.Column('last_connected_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    with op.batch_alter_table('user_stats', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_stats_connection_count'), ['connection_count'], unique=False)
+
+    op.create_table('organization_stats',
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('organization', sa.String(length=100), nullable=False),
+    sa.Column('connection_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('event_id', 'organization')
+    )
+    with op.batch_alter_table('organization_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_organization_stats_event_count', ['event_id', 'connection_count'], unique=False)
+
+    op.create_table('hourly_stats',
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('connection_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('event_id', 'bucket')
+    )
+
+    op.create_table('badge_revocations',
+    sa.Column('registration_number', sa.String(length=20), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('revoked_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('registration_number')
+    )
+    with op.batch_alter_table('badge_revocations', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_badge_revocations_revoked_at'), ['revoked_at'], unique=False)
+
+    op.create_table('recent_writes',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('written_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('recent_writes')
+    with op.batch_alter_table('badge_revocations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_badge_revocations_revoked_at'))
+
+    op.drop_table('badge_revocations')
+    op.drop_table('hourly_stats')
+    with op.batch_alter_table('organization_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_organization_stats_event_count')
+
+    op.drop_table('organization_stats')
+    with op.batch_alter_table('user_stats', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_stats_connection_count'))
+
+    op.drop_table('user_stats')
@@ -0,0 +1,94 @@
+"""events
+
+Adds events and an event_id to users, themes and connections. Existing rows
+keep event_id NULL until `flask create-event <slug> <name> --adopt-legacy`
+moves them into an event.
+
+Email is no longer unique on its own: it is unique per event, and among
+users without an event (admins, legacy rows) through a partial index.
+
+Revision ID: 0003_events
+Revises: 0002_counters
+Create Date: 2026-10-19 19:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_events'
+down_revision = '0002_counters'
+branch_labels = None
+depends_on = None
+
+# create_all left users.email's unique constraint unnamed. On SQLite the
+# batch copy names it with this convention so it can be dropped; Postgres
+# gave it its own default name.
+NAMING_CONVENTION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def _email_unique_name():
+    return 'users_email_key' if op.get_bind().dialect.name == 'postgresql' else 'uq_users_email'
+
+
+def upgrade():
+    op.create_table('events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('slug', sa.String(length=50), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('starts_at', sa.DateTime(), nullable=True),
+    sa.Column('ends_at', sa.DateTime(), nullable=True),
+    sa.Column('archive_path', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('slug')
+    )
+
+    with op.batch_alter_table('users', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.add_column(sa.Column('event_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_users_event_id_events', 'events', ['event_id'], ['id'])
+        batch_op.drop_constraint(_email_unique_name(), type_='unique')
+        batch_op.create_unique_constraint('uq_users_event_email', ['event_id', 'email'])
+        batch_op.create_index('uq_users_email_no_event', ['email'], unique=True,
+                              postgresql_where=sa.text('event_id IS NULL'),
+                              sqlite_where=sa.text('event_id IS NULL'))
+        batch_op.create_index('ix_users_event_status', ['event_id', 'status'], unique=False)
+
+    with op.batch_alter_table('themes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('event_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_themes_event_id_events', 'events', ['event_id'], ['id'])
+        batch_op.create_index('ix_themes_event_name', ['event_id', 'name'], unique=False)
+
+    with op.batch_alter_table('connections', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('event_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_connections_event_id_events', 'events', ['event_id'], ['id'])
+        batch_op.create_index('ix_connections_event_user', ['event_id', 'user_id'], unique=False)
+        batch_op.create_index('ix_connections_event_connected_user', ['event_id', 'connected_user_id'], unique=False)
+
+
+def downgrade():
+    # Fails if the same email registered for more than one event
+    with op.batch_alter_table('connections', schema=None) as batch_op:
+        batch_op.drop_index('ix_connections_event_connected_user')
+        batch_op.drop_index('ix_connections_event_user')
+        batch_op.drop_constraint('fk_connections_event_id_events', type_='foreignkey')
+        batch_op.drop_column('event_id')
+
+    with op.batch_alter_table('themes', schema=None) as batch_op:
+        batch_op.drop_index('ix_themes_event_name')
+        batch_op.drop_constraint('fk_themes_event_id_events', type_='foreignkey')
+        batch_op.drop_column('event_id')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_event_status')
+        batch_op.drop_index('uq_users_email_no_event',
+                            postgresql_where=sa.text('event_id IS NULL'),
+                            sqlite_where=sa.text('event_id IS NULL'))
+        batch_op.drop_constraint('uq_users_event_email', type_='unique')
+        batch_op.create_unique_constraint(_email_unique_name(), ['email'])
+        batch_op.drop_constraint('fk_users_event_id_events', type_='foreignkey')
+        batch_op.drop_column('event_id')
+
+    op.drop_table('events')
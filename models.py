@@ -1,18 +1,55 @@
 #from app import db
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
 import string
 
-db = SQLAlchemy()
+from db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+class Event(db.Model):
+    __tablename__ = 'events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.String(20), default='active')  # active, archived
+    starts_at = db.Column(db.DateTime)
+    ends_at = db.Column(db.DateTime)
+    archive_path = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'slug': self.slug,
+            'name': self.name,
+            'status': self.status,
+            'starts_at': self.starts_at.isoformat() if self.starts_at else None,
+            'ends_at': self.ends_at.isoformat() if self.ends_at else None
+        }
+
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # The same person may register for several events
+        db.UniqueConstraint('event_id', 'email', name='uq_users_event_email'),
+        # NULLs are distinct in the constraint above, so rows without an
+        # event (legacy users, admins) need their own uniqueness on email
+        db.Index('uq_users_email_no_event', 'email', unique=True,
+                 postgresql_where=db.text('event_id IS NULL'),
+                 sqlite_where=db.text('event_id IS NULL')),
+        db.Index('ix_users_event_status', 'event_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'))
     name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(20))
     organization = db.Column(db.String(100))
     registration_number = db.Column(db.String(20), unique=True, nullable=False)
@@ -37,6 +74,8 @@ class User(db.Model):
     themes = db.relationship('Theme', backref='user', lazy=True, cascade='all, delete-orphan')
     connections = db.relationship('Connection', foreign_keys='Connection.user_id', 
                                   backref='user', lazy=True, cascade='all, delete-orphan')
+    stats = db.relationship('UserStats', backref='user', uselist=False, lazy=True,
+                            cascade='all, delete-orphan')
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -83,6 +122,7 @@ class User(db.Model):
     def to_dict(self, include_themes=False):
         data = {
             'id': self.id,
+            'event_id': self.event_id,
             'name': self.name,
             'email': self.email,
             'phone': self.phone,
@@ -106,8 +146,12 @@ class User(db.Model):
 
 class Theme(db.Model):
     __tablename__ = 'themes'
+    __table_args__ = (
+        db.Index('ix_themes_event_name', 'event_id', 'name'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -121,9 +165,16 @@ class Theme(db.Model):
 
 
 class Connection(db.Model):
+    """A directed connection; on Postgres this table is partitioned by event_id
+    (see the partition-connections command)."""
     __tablename__ = 'connections'
+    __table_args__ = (
+        db.Index('ix_connections_event_user', 'event_id', 'user_id'),
+        db.Index('ix_connections_event_connected_user', 'event_id', 'connected_user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     connected_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     connected_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -134,7 +185,203 @@ class Connection(db.Model):
     def to_dict(self):
         return {
             'id': self.id,
+            'event_id': self.event_id,
             'user_id': self.user_id,
             'connected_user_id': self.connected_user_id,
             'connected_at': self.connected_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+
+class UserStats(db.Model):
+    """Per-user networking counters, kept in step with Connection rows.
+
+    Updated in the same transaction as the connections they count, so
+    /api/analytics/stats never has to scan the connections table.
+    """
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    connection_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    dignitary_connection_count = db.Column(db.Integer, nullable=False, default=0)
+    first_connected_at = db.Column(db.DateTime)
+    last_connected_at = db.Column(db.DateTime)
+    
+    COUNTERS = ('connection_count', 'dignitary_connection_count',
+                'first_connected_at', 'last_connected_at')
+    
+    @staticmethod
+    def record_connection(user_id, connected_user, connected_at):
+        """Count a new connection from user_id to connected_user (no commit)"""
+        dignitary = 1 if connected_user.is_dignitary else 0
+        _upsert(UserStats, ['user_id'], {
+            'user_id': user_id,
+            'connection_count': 1,
+            'dignitary_connection_count': dignitary,
+            'first_connected_at': connected_at,
+            'last_connected_at': connected_at,
+        }, {
+            'connection_count': UserStats.connection_count + 1,
+            'dignitary_connection_count': UserStats.dignitary_connection_count + dignitary,
+            'first_connected_at': db.func.coalesce(UserStats.first_connected_at, connected_at),
+            'last_connected_at': connected_at,
+        })
+    
+    @staticmethod
+    def refresh(user_id):
+        """Recompute one user's counters from Connection, e.g. after a delete (no commit)"""
+        row = UserStats.compute(user_id).get(user_id, dict.fromkeys(UserStats.COUNTERS))
+        stats = db.session.get(UserStats, user_id) or UserStats(user_id=user_id)
+        stats.connection_count = row['connection_count'] or 0
+        stats.dignitary_connection_count = row['dignitary_connection_count'] or 0
+        stats.first_connected_at = row['first_connected_at']
+        stats.last_connected_at = row['last_connected_at']
+        db.session.add(stats)
+        return stats
+    
+    @staticmethod
+    def compute(user_id=None):
+        """Aggregate counters straight from Connection, keyed by user_id"""
+        connected_user = db.aliased(User)
+        query = db.session.query(
+            Connection.user_id,
+            db.func.count(Connection.id),
+            db.func.sum(db.case((connected_user.is_dignitary == True, 1), else_=0)),
+            db.func.min(Connection.connected_at),
+            db.func.max(Connection.connected_at),
+        ).join(connected_user, connected_user.id == Connection.connected_user_id)
+        
+        if user_id is not None:
+            query = query.filter(Connection.user_id == user_id)
+        
+        return {
+            uid: dict(zip(UserStats.COUNTERS, (count, dignitary or 0, first, last)))
+            for uid, count, dignitary, first, last in query.group_by(Connection.user_id)
+        }
+    
+    def to_dict(self):
+        return {
+            'total_connections': self.connection_count,
+            'dignitary_connections': self.dignitary_connection_count,
+            'first_connected_at': self.first_connected_at.isoformat() if self.first_connected_at else None,
+            'last_connected_at': self.last_connected_at.isoformat() if self.last_connected_at else None
+        }
+
+
+def _upsert(model, index_elements, values, set_):
+    """INSERT values, or apply set_ to the existing row on conflict (no commit).
+
+    Works on Postgres and SQLite, so concurrent first writers can't collide.
+    """
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert(model).values(**values).on_conflict_do_update(
+        index_elements=index_elements, set_=set_
+    )
+    db.session.execute(stmt)
+
+
+def _increment_count(model, amount=1, **key):
+    """Upsert model's row for key, adding amount to connection_count (no commit)"""
+    _upsert(model, list(key), dict(key, connection_count=amount),
+            {'connection_count': model.connection_count + amount})
+
+
+class OrganizationStats(db.Model):
+    """Connections made by members of each organization (one per Connection row)"""
+    __tablename__ = 'organization_stats'
+    __table_args__ = (
+        db.Index('ix_organization_stats_event_count', 'event_id', 'connection_count'),
+    )
+    
+    # 0 stands for users registered before events existed (event_id NULL)
+    event_id = db.Column(db.Integer, primary_key=True, default=0)
+    organization = db.Column(db.String(100), primary_key=True)
+    connection_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def record_connection(event_id, organization, amount=1):
+        if organization:
+            _increment_count(OrganizationStats, amount, event_id=event_id or 0, organization=organization)
+    
+    def to_dict(self):
+        return {
+            'organization': self.organization,
+            'connections': self.connection_count
+        }
+
+
+class HourlyStats(db.Model):
+    """Connections created per hour (one per connect, not per Connection row)"""
+    __tablename__ = 'hourly_stats'
+    
+    # 0 stands for users registered before events existed (event_id NULL)
+    event_id = db.Column(db.Integer, primary_key=True, default=0)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    connection_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def bucket_for(moment):
+        return moment.replace(minute=0, second=0, microsecond=0)
+    
+    @staticmethod
+    def record_connection(event_id, connected_at, amount=1):
+        _increment_count(HourlyStats, amount, event_id=event_id or 0, bucket=HourlyStats.bucket_for(connected_at))
+    
+    def to_dict(self):
+        return {
+            'hour': self.bucket.isoformat(),
+            'connections': self.connection_count
+        }
+
+
+class BadgeRevocation(db.Model):
+    """Current badge version for users whose public profile changed.
+
+    Badges embed the version they were issued at; a badge older than the
+    version here is stale and the scan falls back to a live lookup. Users
+    with no row are on version 0.
+    """
+    __tablename__ = 'badge_revocations'
+    
+    registration_number = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    @staticmethod
+    def current_version(registration_number):
+        row = db.session.get(BadgeRevocation, registration_number)
+        return row.version if row else 0
+    
+    @staticmethod
+    def bump(registration_number):
+        """Invalidate badges issued so far for this user (no commit)"""
+        row = db.session.get(BadgeRevocation, registration_number)
+        if row is None:
+            row = BadgeRevocation(registration_number=registration_number, version=0)
+            db.session.add(row)
+        row.version += 1
+        row.revoked_at = datetime.utcnow()
+        return row
+
+
+class RecentWrite(db.Model):
+    """When each user last wrote, so their reads can stay on the primary.
+
+    Lives on the primary, so every worker and host sees the same answer.
+    """
+    __tablename__ = 'recent_writes'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    written_at = db.Column(db.DateTime, nullable=False)
+
+    @staticmethod
+    def touch(user_id):
+        """Record a write by user_id now (no commit)"""
+        now = datetime.utcnow()
+        _upsert(RecentWrite, ['user_id'], {'user_id': user_id, 'written_at': now}, {'written_at': now})
+
+    @staticmethod
+    def within(user_id, seconds):
+        """True if user_id wrote in the last seconds"""
+        row = db.session.get(RecentWrite, user_id)
+        return row is not None and row.written_at > datetime.utcnow() - timedelta(seconds=seconds)